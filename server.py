@@ -1,45 +1,300 @@
 # server.py
 from mcp.server.fastmcp import FastMCP
-from starlette.applications import Starlette
-from starlette.routing import Mount, Host
+from starlette.responses import Response
+import asyncio
+import functools
 import logging
-from kiteconnect import KiteConnect
-import uvicorn
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import httpx
+import orjson
 import os
-from typing import Optional
-from dotenv import load_dotenv
+from typing import Any, Optional
 import argparse
 
-# Load environment variables from .env file
-load_dotenv()
-
 logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
 
 # Create an MCP server
 mcp = FastMCP("Zerodha MCP")
 
-# Parse command line arguments
-parser = argparse.ArgumentParser(description='Zerodha MCP Server')
-parser.add_argument('--api-key', help='Zerodha API Key')
-parser.add_argument('--api-secret', help='Zerodha API Secret')
-parser.add_argument('--port', type=int, default=8001, help='Server port (default: 8001)')
-parser.add_argument('--mode', choices=['stdio', 'sse'], default='stdio', help='Server mode (default: stdio)')
-args = parser.parse_args()
+@dataclass(frozen=True, slots=True)
+class Config:
+    """Resolved server configuration: environment variables first, CLI second."""
+    api_key: str
+    api_secret: str
+    port: int
+    mode: str
+
+def _parse_cli():
+    parser = argparse.ArgumentParser(description='Zerodha MCP Server')
+    parser.add_argument('--api-key', help='Zerodha API Key')
+    parser.add_argument('--api-secret', help='Zerodha API Secret')
+    parser.add_argument('--port', type=int, default=8001, help='Server port (default: 8001)')
+    parser.add_argument('--mode', choices=['stdio', 'sse'], default='stdio', help='Server mode (default: stdio)')
+    return parser.parse_args()
+
+def load_config(args=None) -> Config:
+    """Build a Config from environment variables, falling back to CLI args."""
+    # Load environment variables from .env file
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    api_key = os.getenv('ZERODHA_API_KEY') or (args.api_key if args else None)
+    api_secret = os.getenv('ZERODHA_API_SECRET') or (args.api_secret if args else None)
+    port = int(os.getenv('PORT', str(args.port if args else 8001)))
+    mode = os.getenv('SERVER_MODE', args.mode if args else 'stdio')
+
+    if not api_key or not api_secret:
+        raise ValueError("ZERODHA_API_KEY and ZERODHA_API_SECRET must be set either in .env file or via command line arguments")
+
+    return Config(api_key=api_key, api_secret=api_secret, port=port, mode=mode)
+
+# Parse CLI flags only when run as a script; importing the module (tests,
+# uvicorn workers, reload) skips argparse entirely
+config = load_config(_parse_cli() if __name__ == "__main__" else None)
+API_KEY = config.api_key
+API_SECRET = config.api_secret
+PORT = config.port
+MODE = config.mode
+
+@functools.cache
+def _kite():
+    """Construct the KiteConnect client on first use.
+
+    KiteConnect is only needed for the login/session handshake (REST calls go
+    through httpx below), and importing it pulls in the whole requests/urllib3
+    stack — deferred so short-lived stdio invocations that never hit the auth
+    tools don't pay for it.
+    """
+    from kiteconnect import KiteConnect
+    from requests.adapters import HTTPAdapter
+
+    kite = KiteConnect(api_key=API_KEY)
+
+    # Mount a larger connection pool on KiteConnect's requests.Session so any
+    # concurrent sync calls reuse keep-alive TCP/TLS connections instead of
+    # re-handshaking (the default pool_maxsize=10 discards connections under load)
+    adapter = HTTPAdapter(pool_connections=50, pool_maxsize=100, max_retries=3)
+    kite.reqsession.mount("https://", adapter)
+    kite.reqsession.mount("http://", adapter)
+    return kite
+
+@functools.cache
+def _login_url() -> str:
+    """The login URL depends only on the API key, which is fixed for the
+    process, so compute it once."""
+    return _kite().login_url()
+
+# Shared async HTTP client for Kite REST calls. A single pooled client lets
+# concurrent tool invocations run in parallel on the event loop instead of
+# serialising behind the blocking KiteConnect session.
+_client: Optional[httpx.AsyncClient] = None
+
+def _create_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        base_url="https://api.kite.trade",
+        headers={"X-Kite-Version": "3"},
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+        timeout=httpx.Timeout(30.0, connect=5.0),
+    )
 
-# Get configuration from environment variables or command line arguments
-API_KEY = os.getenv('ZERODHA_API_KEY') or args.api_key
-API_SECRET = os.getenv('ZERODHA_API_SECRET') or args.api_secret
-PORT = int(os.getenv('PORT', str(args.port)))
-MODE = os.getenv('SERVER_MODE', args.mode)
+def _http() -> httpx.AsyncClient:
+    """Return the shared AsyncClient, creating it on first use (stdio mode)."""
+    global _client
+    if _client is None:
+        _client = _create_client()
+    return _client
+
+# Access tokens already issued for a request token. Kite rejects a second
+# generate_session with the same request token, so re-invocations of
+# get_access_token return the cached token instead of a failing round-trip.
+_session_cache: dict[str, str] = {}
+
+def _set_access_token(access_token: str) -> None:
+    """Store the access token on both the KiteConnect client and the shared httpx client."""
+    _kite().set_access_token(access_token)
+    _http().headers["Authorization"] = f"token {API_KEY}:{access_token}"
+
+def _dump(x: Any, _dumps=orjson.dumps) -> str:
+    """Serialize a tool payload as compact JSON.
+
+    FastMCP frames each tool result as a single SSE message, so large
+    holdings/orders payloads can't be streamed record by record; emitting
+    compact JSON instead of the Python repr keeps that one message as small
+    and cheap to produce as possible. orjson's C encoder is several times
+    faster than stdlib json on large orders/holdings responses.
+    """
+    return _dumps(x, default=str).decode()
 
-if not API_KEY or not API_SECRET:
-    raise ValueError("ZERODHA_API_KEY and ZERODHA_API_SECRET must be set either in .env file or via command line arguments")
+def _unwrap(response: httpx.Response) -> Any:
+    """Extract the `data` payload from a Kite API response, raising on errors."""
+    try:
+        payload = response.json()
+    except ValueError:
+        # Gateway error pages and empty bodies aren't JSON; fall back to the
+        # HTTP status below
+        payload = None
+    if response.status_code != 200 or not isinstance(payload, dict) or payload.get("status") != "success":
+        message = payload.get("message") if isinstance(payload, dict) else None
+        raise Exception(message or f"Kite API error (HTTP {response.status_code})")
+    return payload["data"]
+
+# The request helpers bind their collaborators as default arguments so the
+# per-call lookups compile to LOAD_FAST instead of LOAD_GLOBAL. The tool
+# functions themselves can't use this idiom: their signatures define the
+# schema FastMCP advertises to clients.
+async def _kite_get(path: str, _http=_http, _unwrap=_unwrap) -> Any:
+    return _unwrap(await _http().get(path))
+
+async def _kite_post(path: str, data: dict, _http=_http, _unwrap=_unwrap) -> Any:
+    return _unwrap(await _http().post(path, data=data))
+
+async def _kite_put(path: str, data: dict, _http=_http, _unwrap=_unwrap) -> Any:
+    return _unwrap(await _http().put(path, data=data))
+
+async def _kite_delete(path: str, _http=_http, _unwrap=_unwrap) -> Any:
+    return _unwrap(await _http().delete(path))
+
+# Order endpoints precomputed per variety: the hot order path does a dict
+# lookup instead of per-call string formatting, and an unknown variety fails
+# fast before any network work
+_ORDER_PATHS = {v: f"/orders/{v}" for v in ("regular", "amo", "bo", "co", "iceberg", "auction")}
+
+# TTL cache plus in-flight deduplication for idempotent read tools. When an
+# agent fans out several identical calls in a burst, concurrent callers await
+# a single upstream request and later callers get the cached result.
+_cache: dict[str, tuple[float, Any]] = {}
+_inflight: dict[str, "asyncio.Future[Any]"] = {}
+
+def cached(ttl: float = 5.0):
+    """Cache a read tool's result for `ttl` seconds, coalescing concurrent
+    calls with the same arguments into one upstream request."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            key = f"{fn.__name__}:{args}:{sorted(kwargs.items())}"
+            hit = _cache.get(key)
+            if hit is not None and time.monotonic() - hit[0] < ttl:
+                return hit[1]
+            fut = _inflight.get(key)
+            if fut is not None:
+                return await fut
+            fut = asyncio.get_running_loop().create_future()
+            _inflight[key] = fut
+            try:
+                result = await fn(*args, **kwargs)
+            except Exception as e:
+                fut.set_exception(e)
+                # Mark the exception retrieved: with no concurrent waiter the
+                # future is dropped and asyncio would log a spurious
+                # "exception was never retrieved" traceback
+                fut.exception()
+                raise
+            else:
+                _cache[key] = (time.monotonic(), result)
+                fut.set_result(result)
+                return result
+            finally:
+                _inflight.pop(key, None)
+        return wrapper
+    return decorator
+
+class _Batcher:
+    """Batch per-order lookups issued within a short window.
+
+    LLM agents reviewing a day's activity call get_order_history /
+    get_order_trades once per order; collecting the calls that arrive within
+    a few milliseconds and dispatching them as one concurrent batch over the
+    shared connection pool collapses N sequential round-trips into one.
+    """
 
-# Initialize KiteConnect with provided credentials
-kite = KiteConnect(api_key=API_KEY)
+    def __init__(self, fetch, window_ms: float = 5):
+        self._fetch = fetch
+        self._window = window_ms / 1000.0
+        self._pending: list[tuple[str, "asyncio.Future[Any]"]] = []
+        self._handle = None
+
+    def submit(self, order_id: str) -> "asyncio.Future[Any]":
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._pending.append((order_id, fut))
+        if self._handle is None:
+            self._handle = loop.call_later(self._window, self._flush, loop)
+        return fut
+
+    def _flush(self, loop):
+        pending, self._pending = self._pending, []
+        self._handle = None
+        loop.create_task(self._dispatch(pending))
+
+    async def _dispatch(self, pending):
+        ids = list(dict.fromkeys(order_id for order_id, _ in pending))
+        results = await asyncio.gather(*(self._fetch(i) for i in ids), return_exceptions=True)
+        by_id = dict(zip(ids, results))
+        for order_id, fut in pending:
+            result = by_id[order_id]
+            if fut.done():
+                continue
+            if isinstance(result, BaseException):
+                fut.set_exception(result)
+            else:
+                fut.set_result(result)
+
+_history_batcher = _Batcher(lambda order_id: _kite_get(f"/orders/{order_id}"))
+_trades_batcher = _Batcher(lambda order_id: _kite_get(f"/orders/{order_id}/trades"))
+
+def single_flight(fn):
+    """Coalesce concurrent identical calls into one upstream request.
+
+    Unlike @cached this keeps no result around: only callers that overlap an
+    in-flight request share its outcome. Apply to idempotent reads only —
+    never to order-entry tools.
+    """
+    _pending: dict[tuple, "asyncio.Future[Any]"] = {}
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        key = (fn.__name__, args, tuple(sorted(kwargs.items())))
+        fut = _pending.get(key)
+        if fut is not None:
+            return await fut
+        fut = asyncio.get_running_loop().create_future()
+        _pending[key] = fut
+        try:
+            result = await fn(*args, **kwargs)
+        except Exception as e:
+            fut.set_exception(e)
+            # Mark the exception retrieved: with no concurrent waiter the
+            # future is dropped and asyncio would log a spurious
+            # "exception was never retrieved" traceback
+            fut.exception()
+            raise
+        else:
+            fut.set_result(result)
+            return result
+        finally:
+            _pending.pop(key, None)
+    return wrapper
+
+async def _startup():
+    global _client
+    _client = _create_client()
+    # Bound the thread pool used by asyncio.to_thread for the remaining sync
+    # KiteConnect calls, sized to match the connection pool above
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=32))
+    log.info("Zerodha MCP Server started")
+
+async def _shutdown():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+    log.info("Zerodha MCP Server shutting down")
 
 @mcp.tool()
-def get_login_url() -> str:
+async def get_login_url() -> str:
     """Get the login URL for the user. Use this to get the login URL for the user and then redirect the user to the login URL to get the request token.
 
     Args:
@@ -48,13 +303,13 @@ def get_login_url() -> str:
     Returns:
         str: The login URL for the user
     """
-    logging.info("Entering get_login_url")
-    url = kite.login_url()
-    logging.info("Exiting get_login_url")
+    log.info("Entering get_login_url")
+    url = _login_url()
+    log.info("Exiting get_login_url")
     return url
 
 @mcp.tool()
-def get_access_token(request_token: str) -> str:
+async def get_access_token(request_token: str) -> str:
     """Get the access token for the user.
 
     Args:
@@ -63,16 +318,24 @@ def get_access_token(request_token: str) -> str:
     Returns:
         str: The access token for the user
     """
-    logging.info("Entering get_access_token")
-    data = kite.generate_session(request_token, api_secret=API_SECRET)
+    log.info("Entering get_access_token")
+    if request_token in _session_cache:
+        log.info("Exiting get_access_token (cached)")
+        return _session_cache[request_token]
 
-    kite.set_access_token(data['access_token'])
-    logging.info("Exiting get_access_token")
+    data = await asyncio.to_thread(
+        functools.partial(_kite().generate_session, request_token, api_secret=API_SECRET)
+    )
+
+    _set_access_token(data['access_token'])
+    _session_cache[request_token] = data['access_token']
+    log.info("Exiting get_access_token")
     return data['access_token']
 
 
 @mcp.tool()
-def get_user_profile() -> str:
+@cached(ttl=5)
+async def get_user_profile() -> str:
     """Get the authenticated user's Zerodha profile information.
 
     Retrieves details like:
@@ -86,17 +349,19 @@ def get_user_profile() -> str:
     - Account activation status
 
     Returns:
-        str: A string representation of the user's complete profile information from Zerodha
+        str: A JSON string of the user's complete profile information from Zerodha
     """
-    logging.info("Entering get_user_profile")
+    log.info("Entering get_user_profile")
     # Get user profile
-    profile = kite.profile()
-    logging.info("Profile: %s", profile)
-    logging.info("Exiting get_user_profile")
-    return str(profile)
+    profile = await _kite_get("/user/profile")
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("Profile: %s", profile)
+    log.info("Exiting get_user_profile")
+    return _dump(profile)
 
 @mcp.tool()
-def get_margins(segment: str) -> str:
+@cached(ttl=5)
+async def get_margins(segment: str) -> str:
     """Get the user's available margins and fund details from Zerodha.
 
     Retrieves information including:
@@ -115,17 +380,19 @@ def get_margins(segment: str) -> str:
             If not specified, returns margins for all segments.
 
     Returns:
-        str: A string representation of the complete margins and funds information
+        str: A JSON string of the complete margins and funds information
     """
-    logging.info("Entering get_margins with segment: %s", segment)
+    log.info("Entering get_margins with segment: %s", segment)
     # Get margins for all segments
-    margins = kite.margins(segment=segment)
-    logging.info("Margins: %s", margins)
-    logging.info("Exiting get_margins")
-    return str(margins)
+    margins = await _kite_get(f"/user/margins/{segment}" if segment else "/user/margins")
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("Margins: %s", margins)
+    log.info("Exiting get_margins")
+    return _dump(margins)
 
 @mcp.tool()
-def get_holdings() -> str:
+@cached(ttl=5)
+async def get_holdings() -> str:
     """Get the user's portfolio holdings from Zerodha.
 
     Retrieves detailed information about all securities currently held in the portfolio, including:
@@ -141,16 +408,19 @@ def get_holdings() -> str:
     - Value
 
     Returns:
-        str: A string representation of the complete holdings information
+        str: A JSON string of the complete holdings information
     """
-    logging.info("Entering get_holdings")
-    holdings = kite.holdings()
-    logging.info("Holdings: %s", holdings)
-    logging.info("Exiting get_holdings")
-    return str(holdings)
+    log.info("Entering get_holdings")
+    holdings = await _kite_get("/portfolio/holdings")
+    log.info("holdings n=%d", len(holdings))
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("Holdings: %s", holdings)
+    log.info("Exiting get_holdings")
+    return _dump(holdings)
 
 @mcp.tool()
-def get_positions() -> str:
+@cached(ttl=5)
+async def get_positions() -> str:
     """Get the user's current positions from Zerodha.
 
     Retrieves information about all open positions, including:
@@ -167,16 +437,18 @@ def get_positions() -> str:
     - Multiplier
 
     Returns:
-        str: A string representation of the complete positions information
+        str: A JSON string of the complete positions information
     """
-    logging.info("Entering get_positions")
-    positions = kite.positions()
-    logging.info("Positions: %s", positions)
-    logging.info("Exiting get_positions")
-    return str(positions)
+    log.info("Entering get_positions")
+    positions = await _kite_get("/portfolio/positions")
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("Positions: %s", positions)
+    log.info("Exiting get_positions")
+    return _dump(positions)
 
 @mcp.tool()
-def get_orders() -> str:
+@cached(ttl=5)
+async def get_orders() -> str:
     """Get all orders placed for the day.
 
     Retrieves detailed information about all orders placed during the current day, including:
@@ -200,16 +472,19 @@ def get_orders() -> str:
     - Order variety (regular, amo, bo, co, etc)
 
     Returns:
-        str: A string representation of all orders for the day
+        str: A JSON string of all orders for the day
     """
-    logging.info("Entering get_orders")
-    orders = kite.orders()
-    logging.info("Orders: %s", orders)
-    logging.info("Exiting get_orders")
-    return str(orders)
+    log.info("Entering get_orders")
+    orders = await _kite_get("/orders")
+    log.info("orders n=%d", len(orders))
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("Orders: %s", orders)
+    log.info("Exiting get_orders")
+    return _dump(orders)
 
 @mcp.tool()
-def get_order_history(order_id: str) -> str:
+@single_flight
+async def get_order_history(order_id: str) -> str:
     """Get history of an order.
 
     Retrieves detailed information about all states an order has gone through, including:
@@ -225,16 +500,19 @@ def get_order_history(order_id: str) -> str:
         order_id (str): ID of the order whose history is to be retrieved
 
     Returns:
-        str: A string representation of the complete order history
+        str: A JSON string of the complete order history
     """
-    logging.info("Entering get_order_history with order_id: %s", order_id)
-    history = kite.order_history(order_id)
-    logging.info("Order history: %s", history)
-    logging.info("Exiting get_order_history")
-    return str(history)
+    log.info("Entering get_order_history with order_id: %s", order_id)
+    history = await _history_batcher.submit(order_id)
+    log.info("order history n=%d", len(history))
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("Order history: %s", history)
+    log.info("Exiting get_order_history")
+    return _dump(history)
 
 @mcp.tool()
-def get_order_trades(order_id: str) -> str:
+@single_flight
+async def get_order_trades(order_id: str) -> str:
     """Get trades generated by an order.
 
     An order can be executed in multiple trades. Use this to get all trades linked to an order.
@@ -243,16 +521,18 @@ def get_order_trades(order_id: str) -> str:
         order_id (str): ID of the order whose trades are to be retrieved
 
     Returns:
-        str: A string representation of all trades for the given order
+        str: A JSON string of all trades for the given order
     """
-    logging.info("Entering get_order_trades with order_id: %s", order_id)
-    trades = kite.order_trades(order_id)
-    logging.info("Order trades: %s", trades)
-    logging.info("Exiting get_order_trades")
-    return str(trades)
+    log.info("Entering get_order_trades with order_id: %s", order_id)
+    trades = await _trades_batcher.submit(order_id)
+    log.info("order trades n=%d", len(trades))
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("Order trades: %s", trades)
+    log.info("Exiting get_order_trades")
+    return _dump(trades)
 
 @mcp.tool()
-def place_order(exchange: str, tradingsymbol: str, transaction_type: str,
+async def place_order(exchange: str, tradingsymbol: str, transaction_type: str,
                 quantity: int, price: float, product: str = "CNC",
                 order_type: str = "MARKET", validity: str = "DAY", variety: str = "regular") -> str:
     """Place a new order on Zerodha.
@@ -270,27 +550,29 @@ def place_order(exchange: str, tradingsymbol: str, transaction_type: str,
     Returns:
         str: Order ID of the placed order
     """
-    logging.info(f"Entering place_order: exchange={exchange}, symbol={tradingsymbol}, type={transaction_type}, qty={quantity}, price={price}, product={product}, order_type={order_type}")
+    log.info("Entering place_order: exchange=%s, symbol=%s, type=%s, qty=%s, price=%s, product=%s, order_type=%s", exchange, tradingsymbol, transaction_type, quantity, price, product, order_type)
     try:
-        order_id = kite.place_order(
-            exchange=exchange,
-            tradingsymbol=tradingsymbol,
-            transaction_type=transaction_type,
-            quantity=quantity,
-            price=price,
-            product=product,
-            order_type=order_type,
-            validity=validity,
-            variety=variety
-        )
-        logging.info("Order placed. ID: %s", order_id)
+        if variety not in _ORDER_PATHS:
+            raise ValueError(f"invalid order variety: {variety}")
+        data = await _kite_post(_ORDER_PATHS[variety], data={
+            "exchange": exchange,
+            "tradingsymbol": tradingsymbol,
+            "transaction_type": transaction_type,
+            "quantity": quantity,
+            "price": price,
+            "product": product,
+            "order_type": order_type,
+            "validity": validity
+        })
+        order_id = data["order_id"]
+        log.info("Order placed. ID: %s", order_id)
         return f"Order placed successfully. Order ID: {order_id}"
     except Exception as e:
-        logging.error("Order placement failed: %s", str(e))
-        return f"Order placement failed: {str(e)}"
+        log.error("Order placement failed: %s", str(e))
+        return f"Order placement failed: {e!s}"
 
 @mcp.tool()
-def modify_order(order_id: str, quantity: int,price: float, order_type: str,
+async def modify_order(order_id: str, quantity: int,price: float, order_type: str,
                 trigger_price: float, validity: str) -> str:
     """Modify an existing order.
 
@@ -305,24 +587,24 @@ def modify_order(order_id: str, quantity: int,price: float, order_type: str,
     Returns:
         str: Order ID of the modified order
     """
-    logging.info(f"Entering modify_order: order_id={order_id}, quantity={quantity}, price={price}, order_type={order_type}")
+    log.info("Entering modify_order: order_id=%s, quantity=%s, price=%s, order_type=%s", order_id, quantity, price, order_type)
     try:
-        order_id_resp = kite.modify_order(
-            order_id=order_id,
-            quantity=quantity,
-            price=price,
-            order_type=order_type,
-            trigger_price=trigger_price,
-            validity=validity
-        )
-        logging.info("Order modified. ID: %s", order_id_resp)
+        data = await _kite_put(f"{_ORDER_PATHS['regular']}/{order_id}", data={
+            "quantity": quantity,
+            "price": price,
+            "order_type": order_type,
+            "trigger_price": trigger_price,
+            "validity": validity
+        })
+        order_id_resp = data["order_id"]
+        log.info("Order modified. ID: %s", order_id_resp)
         return f"Order modified successfully. Order ID: {order_id_resp}"
     except Exception as e:
-        logging.error("Order modification failed: %s", str(e))
-        return f"Order modification failed: {str(e)}"
+        log.error("Order modification failed: %s", str(e))
+        return f"Order modification failed: {e!s}"
 
 @mcp.tool()
-def cancel_order(order_id: str, variety: str = "regular") -> str:
+async def cancel_order(order_id: str, variety: str = "regular") -> str:
     """Cancel an order.
 
     Args:
@@ -332,32 +614,53 @@ def cancel_order(order_id: str, variety: str = "regular") -> str:
     Returns:
         str: Order ID of the cancelled order
     """
-    logging.info(f"Entering cancel_order: order_id={order_id}")
+    log.info("Entering cancel_order: order_id=%s", order_id)
     try:
-        order_id_resp = kite.cancel_order(variety=variety, order_id=order_id)
-        logging.info("Order cancelled. ID: %s", order_id_resp)
+        if variety not in _ORDER_PATHS:
+            raise ValueError(f"invalid order variety: {variety}")
+        data = await _kite_delete(f"{_ORDER_PATHS[variety]}/{order_id}")
+        order_id_resp = data["order_id"]
+        log.info("Order cancelled. ID: %s", order_id_resp)
         return f"Order cancelled successfully. Order ID: {order_id_resp}"
     except Exception as e:
-        logging.error("Order cancellation failed: %s", str(e))
-        return f"Order cancellation failed: {str(e)}"
+        log.error("Order cancellation failed: %s", str(e))
+        return f"Order cancellation failed: {e!s}"
+
+class ORJSONResponse(Response):
+    """JSON response rendered with orjson, sharing the C encoder used by
+    _dump for tool payloads. Use this for any plain-HTTP route instead of
+    Starlette's stdlib-json JSONResponse. (MCP SSE frames are encoded inside
+    the mcp library and don't go through a Response class.)"""
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content)
+
+# Serve the MCP SSE app directly instead of mounting it inside another
+# Starlette instance, which would layer ServerErrorMiddleware and
+# ExceptionMiddleware around every request/SSE frame. A thin pure-ASGI
+# wrapper handles lifespan for client setup/teardown and passes all other
+# scopes straight through. Defined at module level so uvicorn workers can
+# import it as "server:app".
+_sse_app = mcp.sse_app()
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await _startup()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await _shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    elif scope["type"] == "http" and scope["path"] == "/health":
+        await ORJSONResponse({"status": "ok"})(scope, receive, send)
+    else:
+        await _sse_app(scope, receive, send)
 
 if MODE == 'sse':
-    # Mount the SSE server to the existing ASGI server
-    app = Starlette(
-        routes=[
-            Mount('/', app=mcp.sse_app()),
-        ],
-        debug=True,
-        on_startup=[
-            # Add startup event handler to log server start
-            lambda: logging.info("Zerodha MCP Server started")
-        ],
-        on_shutdown=[
-            # Add shutdown event handler for cleanup
-            lambda: logging.info("Zerodha MCP Server shutting down")
-        ]
-    )
-
     # Run the ASGI server
     if __name__ == "__main__":
         # Configure logging
@@ -366,13 +669,28 @@ if MODE == 'sse':
             format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
         )
 
-        # Run server with configurable host/port and enable reload for development
+        # Export the resolved config so worker processes, which re-import
+        # this module, see the same settings even when they came in via CLI
+        os.environ.setdefault('ZERODHA_API_KEY', API_KEY)
+        os.environ.setdefault('ZERODHA_API_SECRET', API_SECRET)
+        os.environ.setdefault('PORT', str(PORT))
+        os.environ.setdefault('SERVER_MODE', MODE)
+
+        # Default to a single worker: the SSE transport keeps session streams
+        # in a per-process dict and the access token lives on the handling
+        # worker's httpx client, so without session-sticky routing a second
+        # worker 404s the client's POST /messages and loses auth state.
+        # UVICORN_WORKERS can raise this behind a sticky load balancer.
+        import uvicorn
         uvicorn.run(
-            app,
+            "server:app",
             host="0.0.0.0",
             port=PORT,
-            log_level="info",
-            access_log=True
+            workers=int(os.getenv('UVICORN_WORKERS', '1')),
+            loop="uvloop",
+            http="httptools",
+            log_level="warning",
+            access_log=False
         )
 # else:
 #     # Run in stdio mode